@@ -1,6 +1,6 @@
 
 import os
-from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
 from langchain_core.language_models.chat_models import (
     BaseChatModel,
     agenerate_from_stream,
@@ -26,7 +26,11 @@ from langchain_core.messages import (
 )
 from langchain_core.pydantic_v1 import BaseModel, Field, SecretStr, root_validator
 
-from prodpadlm_client.resources.api import ProdPADLM_API
+from prodpadlm_client.resources.api import DEFAULT_MAX_WORKERS, ProdPADLM_API
+from prodpadlm_client.resources.budget import ContextBudgeter
+from prodpadlm_client.resources.cache import NearDuplicateCache
+from prodpadlm_client.resources.profiler import stage
+from prodpadlm_client.resources.scheduler import RequestScheduler
 
 
 _message_type_lookups = {"human": "user", "ai": "assistant"}
@@ -81,7 +85,8 @@ def _format_messages(messages: List[BaseMessage]) -> Tuple[Optional[str], List[D
     system: Optional[str] = None
     formatted_messages: List[Dict] = []
 
-    merged_messages = _merge_messages(messages)
+    with stage("merge_messages"):
+        merged_messages = _merge_messages(messages)
     for i, message in enumerate(merged_messages):
         if message.type == "system":
             if i != 0:
@@ -176,6 +181,34 @@ class ProdPadLMChat(BaseChatModel):
     streaming: bool = False
     """Whether to use streaming or not."""
 
+    scheduler: Optional[RequestScheduler] = None
+    """Optional request scheduler shared by the sync and async clients.
+
+    When set, `priority` and `deadline` may be passed per call, e.g.
+    ``model.invoke(messages, priority="batch", deadline=30)``."""
+
+    prompt_cache: Optional[NearDuplicateCache] = None
+    """Optional near-duplicate response cache for non-streaming calls."""
+
+    context_budgeter: Optional[ContextBudgeter] = None
+    """Optional budgeter that drops or summarises old turns to fit the context window.
+
+    A plain summarizer runs inline on sync calls and in a worker thread on async
+    calls; pass a coroutine function to summarise without a thread on ``ainvoke``."""
+
+    warmup_connections: int = 0
+    """Number of connections to open when the model is constructed."""
+
+    max_workers: int = DEFAULT_MAX_WORKERS
+    """Number of worker threads `parallel_map` fans requests out over."""
+
+    keepalive_min_idle: int = 0
+    """If positive, keep this many idle connections warm from a background thread.
+
+    The model owns that thread: call `stop_keepalive` or `close` when the model
+    is no longer needed. The thread also exits on its own once the model's
+    client has been garbage collected."""
+
     @property
     def _llm_type(self) -> str:
         """Return type of chat model."""
@@ -208,25 +241,34 @@ class ProdPadLMChat(BaseChatModel):
             api_key=api_key,
             base_url=api_url,
             default_headers=values.get("default_headers"),
+            scheduler=values.get("scheduler"),
+            cache=values.get("prompt_cache"),
+            max_workers=values.get("max_workers") or DEFAULT_MAX_WORKERS,
         )
+        if values.get("warmup_connections"):
+            values["_client"].warmup(values["warmup_connections"])
+        if values.get("keepalive_min_idle"):
+            values["_client"].start_keepalive(values["keepalive_min_idle"])
      
         values["_async_client"] = ProdPADLM_API.AsyncClient(
             api_key=api_key,
             base_url=api_url,
             default_headers=values.get("default_headers"),
+            scheduler=values.get("scheduler"),
+            cache=values.get("prompt_cache"),
         )
         return values
 
-    def _format_params(
+    def _unfitted_params(
         self,
-        *,
         messages: List[BaseMessage],
-        stop: Optional[List[str]] = None,
-        **kwargs: Dict,
+        stop: Optional[List[str]],
+        **kwargs: Any,
     ) -> Dict:
         # get system prompt if any
-        system, formatted_messages = _format_messages(messages)
-        rtn = {
+        with stage("format_messages"):
+            system, formatted_messages = _format_messages(messages)
+        return {
             "max_tokens": self.max_tokens,
             "messages": formatted_messages,
             "temperature": self.temperature,
@@ -237,10 +279,38 @@ class ProdPadLMChat(BaseChatModel):
             **self.model_kwargs,
             **kwargs,
         }
+
+    def _format_params(
+        self,
+        *,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        **kwargs: Dict,
+    ) -> Dict:
+        rtn = self._unfitted_params(messages, stop, **kwargs)
+        if self.context_budgeter is not None:
+            rtn["system"], rtn["messages"] = self.context_budgeter.fit(
+                rtn["system"], rtn["messages"], rtn["max_tokens"]
+            )
         rtn = {k: v for k, v in rtn.items() if v is not None}
 
         return rtn
 
+    async def _aformat_params(
+        self,
+        *,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        **kwargs: Dict,
+    ) -> Dict:
+        """Like `_format_params`, but never runs the budgeter's summarizer on the event loop."""
+        rtn = self._unfitted_params(messages, stop, **kwargs)
+        if self.context_budgeter is not None:
+            rtn["system"], rtn["messages"] = await self.context_budgeter.afit(
+                rtn["system"], rtn["messages"], rtn["max_tokens"]
+            )
+        return {k: v for k, v in rtn.items() if v is not None}
+
     def _stream(
         self,
         messages: List[BaseMessage],
@@ -254,11 +324,50 @@ class ProdPadLMChat(BaseChatModel):
                 for text in strm.text_stream:
                     chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
                     if run_manager:
-                        run_manager.on_llm_new_token(text, chunk=chunk)
+                        with stage("callbacks"):
+                            run_manager.on_llm_new_token(text, chunk=chunk)
                     yield chunk
 
   
 
+    def warmup(self, n: int) -> int:
+        """Open ``n`` connections to the endpoint ahead of the first request."""
+        return self._client.warmup(n)
+
+    def connection_stats(self) -> Dict[str, Any]:
+        """Return warm-pool size and request/probe cold-connect counts for the sync client."""
+        return self._client.connection_stats()
+
+    def stop_keepalive(self) -> None:
+        """Stop the background keep-alive thread, if one is running."""
+        self._client.stop_keepalive()
+
+    def close(self) -> None:
+        """Stop keep-alive, shut down worker threads and close pooled connections."""
+        self._client.close()
+
+    def parallel_map(
+        self,
+        inputs: Iterable[List[BaseMessage]],
+        stop: Optional[List[str]] = None,
+        *,
+        max_in_flight: Optional[int] = None,
+        **kwargs: Any,
+    ) -> Iterator[AIMessage]:
+        """Generate a reply for each list of messages, yielding them in input order.
+
+        Requests are fanned out over the sync client's ``max_workers`` threads
+        and share its connection pool, so at most ``min(max_in_flight,
+        max_workers)`` run at once. LangChain callbacks are not invoked; use
+        `batch` when they are needed.
+        """
+        params = (
+            self._format_params(messages=messages, stop=stop, **kwargs)
+            for messages in inputs
+        )
+        for data in self._client.map(params, max_in_flight=max_in_flight):
+            yield self._format_output(data).generations[0].message
+
     def _format_output(self, data: Any, **kwargs: Any) -> ChatResult:
         data_dict = data.model_dump()
         content = data_dict["content"]
@@ -281,13 +390,13 @@ class ProdPadLMChat(BaseChatModel):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> ChatResult:
-        params = self._format_params(messages=messages, stop=stop, **kwargs)
         if self.streaming:
             stream_iter = self._stream(
                     messages, stop=stop, run_manager=run_manager, **kwargs
                 )
             return generate_from_stream(stream_iter)
         else:
+            params = self._format_params(messages=messages, stop=stop, **kwargs)
             data = self._client.create(**params)
         return self._format_output(data, **kwargs)
     
@@ -298,13 +407,13 @@ class ProdPadLMChat(BaseChatModel):
         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> ChatResult:
-        params = self._format_params(messages=messages, stop=stop, **kwargs)
         if self.streaming:
             stream_iter = self._astream(
                 messages, stop=stop, run_manager=run_manager, **kwargs
             )
             return await agenerate_from_stream(stream_iter)
         else:
+            params = await self._aformat_params(messages=messages, stop=stop, **kwargs)
             data = await self._async_client.create(**params)
         return self._format_output(data, **kwargs)
 
@@ -0,0 +1,23 @@
+import json
+from typing import Any
+
+
+def content_text(content: Any) -> str:
+    """Flatten message ``content`` (a string or a list of blocks) into plain text.
+
+    Text and ``tool_result`` blocks contribute their text; any other block is
+    included as its JSON encoding.
+    """
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content or []:
+        if isinstance(block, str):
+            parts.append(block)
+        elif block.get("type") == "text":
+            parts.append(block.get("text", ""))
+        elif block.get("type") == "tool_result":
+            parts.append(content_text(block.get("content")))
+        else:
+            parts.append(json.dumps(block, sort_keys=True, default=str))
+    return " ".join(parts)
@@ -1,5 +1,11 @@
+import asyncio
+import contextvars
 import json
-from typing import Iterable, List
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 import httpx
 from typing_extensions import Literal, Required, TypedDict
 
@@ -7,6 +13,11 @@ from prodpadlm_client.client_types._types import *
 
 from prodpadlm_client.client_types.messages import Message
 from prodpadlm_client.client_types.stream_messages import MessageStreamManager
+from prodpadlm_client.resources.cache import NearDuplicateCache
+from prodpadlm_client.resources.profiler import http_trace, stage
+from prodpadlm_client.resources.resume import StreamResumeState
+from prodpadlm_client.resources.scheduler import RequestScheduler
+from prodpadlm_client.resources.warmup import ConnectionWarmer
 
 # default timeout is 10 minutes
 DEFAULT_TIMEOUT = httpx.Timeout(timeout=600.0, connect=5.0)
@@ -14,6 +25,7 @@ DEFAULT_MAX_RETRIES = 2
 DEFAULT_CONNECTION_LIMITS = httpx.Limits(
     max_connections=1000, max_keepalive_connections=100
 )
+DEFAULT_MAX_WORKERS = 16
 
 __all__ = ["MessageParam"]
 
@@ -37,6 +49,16 @@ def parse_concatenated_json(string):
                 break
         return objects
 
+def _encode_body(body: Dict[str, Any]) -> bytes:
+    with stage("json_encode"):
+        return json.dumps(body).encode()
+
+
+@asynccontextmanager
+async def _null_async_slot():
+    yield
+
+
 class MessageParam(TypedDict, total=False):
     content: str
 
@@ -46,10 +68,141 @@ class MessageParam(TypedDict, total=False):
 class ProdPADLM_API:
         
     class Client:
-        def __init__(self, api_key: str, base_url: str, default_headers: str = ""):
+        """Synchronous client.
+
+        A single instance is safe to share between threads: all requests go
+        through one `httpx.Client` connection pool (bounded by
+        `DEFAULT_CONNECTION_LIMITS`), and the optional scheduler and cache
+        guard their own state. `map` and `imap_unordered` fan `create` calls
+        out over a thread pool owned by the client; call `close` to release it.
+        """
+
+        def __init__(
+            self,
+            api_key: str,
+            base_url: str,
+            default_headers: str = "",
+            scheduler: Optional[RequestScheduler] = None,
+            cache: Optional[NearDuplicateCache] = None,
+            max_workers: int = DEFAULT_MAX_WORKERS,
+            track_connections: bool = False,
+        ):
             headers = {"Content-Type": "application/json", "X-API-Key": api_key}
-            self._post = httpx.Client(headers=headers)
+            self._post = httpx.Client(headers=headers, limits=DEFAULT_CONNECTION_LIMITS)
             self.url = base_url
+            self.scheduler = scheduler
+            self.cache = cache
+            self.max_workers = max_workers
+            self._executor: Optional[ThreadPoolExecutor] = None
+            self._executor_lock = threading.Lock()
+            self._warmer = ConnectionWarmer(
+                self,
+                keepalive_expiry=DEFAULT_CONNECTION_LIMITS.keepalive_expiry,
+                max_keepalive=DEFAULT_CONNECTION_LIMITS.max_keepalive_connections,
+            )
+            self._warmer.tracking = track_connections
+
+        def warmup(self, n: int) -> int:
+            """Open ``n`` pooled connections ahead of time; returns the warm pool size."""
+            return self._warmer.warmup(n)
+
+        def start_keepalive(self, min_idle: int, interval: Optional[float] = None) -> None:
+            """Keep at least ``min_idle`` connections warm from a background thread."""
+            self._warmer.start(min_idle, interval)
+
+        def stop_keepalive(self) -> None:
+            self._warmer.stop()
+
+        def connection_stats(self) -> Dict[str, Any]:
+            """Return warm-pool size, request/probe cold connects and probe counters.
+
+            Requests are only counted once `warmup` or `start_keepalive` has been
+            called, or when the client was created with ``track_connections=True``.
+            """
+            return self._warmer.stats()
+
+        def _get_executor(self) -> ThreadPoolExecutor:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="prodpadlm"
+                    )
+                return self._executor
+
+        def close(self) -> None:
+            """Shut down the worker pool and close pooled connections."""
+            self._warmer.close()
+            with self._executor_lock:
+                executor, self._executor = self._executor, None
+            if executor is not None:
+                executor.shutdown(wait=True)
+            self._post.close()
+
+        def map(
+            self,
+            requests: Iterable[Dict[str, Any]],
+            *,
+            max_in_flight: Optional[int] = None,
+        ) -> Iterator[Message]:
+            """Run `create(**params)` for each params dict, yielding results in order.
+
+            At most ``max_in_flight`` requests (default: ``max_workers``) are
+            submitted at once, so arbitrarily long iterables are consumed lazily.
+            No more than ``max_workers`` of them run concurrently; a larger
+            ``max_in_flight`` only queues more work on the pool.
+            An exception raised by a request is re-raised when its result is reached.
+            """
+            executor = self._get_executor()
+            limit = max_in_flight or self.max_workers
+            requests = iter(requests)
+            window: deque = deque()
+            try:
+                for params in requests:
+                    window.append(
+                        executor.submit(contextvars.copy_context().run, self.create, **params)
+                    )
+                    if len(window) >= limit:
+                        yield window.popleft().result()
+                while window:
+                    yield window.popleft().result()
+            finally:
+                for future in window:
+                    future.cancel()
+
+        def imap_unordered(
+            self,
+            requests: Iterable[Dict[str, Any]],
+            *,
+            max_in_flight: Optional[int] = None,
+        ) -> Iterator[Tuple[int, Message]]:
+            """Like `map`, but yield ``(index, message)`` pairs as requests complete."""
+            executor = self._get_executor()
+            limit = max_in_flight or self.max_workers
+            requests = enumerate(requests)
+            pending: Dict[Any, int] = {}
+            try:
+                for index, params in requests:
+                    future = executor.submit(
+                        contextvars.copy_context().run, self.create, **params
+                    )
+                    pending[future] = index
+                    if len(pending) < limit:
+                        continue
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        def _slot(self, priority: Optional[str], deadline: Optional[float]):
+            if self.scheduler is None:
+                return nullcontext()
+            return self.scheduler.acquire(priority, deadline)
 
         def create(
             self,
@@ -63,23 +216,44 @@ class ProdPADLM_API:
             top_k: int = 0,
             top_p: float = 0,
             stream: bool = False,
+            priority: Optional[str] = None,
+            deadline: Optional[float] = None,
         ) -> Message:
-            response = self._post.post(
-                self.url + "/api/v1/generate",
-                json={
-                    "max_tokens": max_tokens,
-                    "messages": messages,
-                    "model": model,
-                    "stop_sequences": stop_sequences,
-                    "stream": stream,
-                    "system": system,
-                    "temperature": temperature,
-                    "top_k": top_k,
-                    "top_p": top_p,
-                },
-                timeout= DEFAULT_TIMEOUT
-            )
-            resp = Message(**response.json())
+            cache_params = {
+                "max_tokens": max_tokens,
+                "model": model,
+                "stop_sequences": stop_sequences,
+                "temperature": temperature,
+                "top_k": top_k,
+                "top_p": top_p,
+            }
+            prepared = None
+            if self.cache is not None:
+                prepared = self.cache.prepare(system, messages, **cache_params)
+                cached = self.cache.lookup(system, messages, prepared=prepared)
+                if cached is not None:
+                    return cached
+            with self._slot(priority, deadline):
+                response = self._post.post(
+                    self.url + "/api/v1/generate",
+                    content=_encode_body({
+                        "max_tokens": max_tokens,
+                        "messages": messages,
+                        "model": model,
+                        "stop_sequences": stop_sequences,
+                        "stream": stream,
+                        "system": system,
+                        "temperature": temperature,
+                        "top_k": top_k,
+                        "top_p": top_p,
+                    }),
+                    timeout= DEFAULT_TIMEOUT,
+                    extensions=http_trace(observer=self._warmer.request_observer()),
+                )
+                with stage("parse_response"):
+                    resp = Message(**response.json())
+            if self.cache is not None:
+                self.cache.store(system, messages, resp, prepared=prepared)
             return resp
         
 
@@ -94,39 +268,81 @@ class ProdPADLM_API:
             temperature: float = 0.7,
             top_k: int = 0,
             top_p: float = 0,
+            priority: Optional[str] = None,
+            deadline: Optional[float] = None,
+            max_resumes: int = DEFAULT_MAX_RETRIES,
         ) -> Message:
+            """Stream a generation, resuming up to ``max_resumes`` times after a
+            transport error. See `StreamResumeState` for the resume protocol."""
+            body = {
+                "max_tokens": max_tokens,
+                "messages": messages,
+                "model": model,
+                "stop_sequences": stop_sequences,
+                "stream": True,
+                "system": system,
+                "temperature": temperature,
+                "top_k": top_k,
+                "top_p": top_p,
+            }
+            state = StreamResumeState()
+            with self._slot(priority, deadline):
+                while True:
+                    try:
+                        yield from self._stream_events(body, state)
+                        return
+                    except httpx.TransportError:
+                        if state.resumes >= max_resumes or not state.can_resume:
+                            raise
+                        state.mark_resumed()
+                        resume = state.resume_request()
+                        if resume is not None:
+                            body = {**body, "resume": resume}
+
+        def _stream_events(self, body: Dict[str, Any], state: StreamResumeState):
             with self._post.stream("POST", self.url + "/api/v1/generate",
-                                    json={
-                                    "max_tokens": max_tokens,
-                                    "messages": messages,
-                                    "model": model,
-                                    "stop_sequences": stop_sequences,
-                                    "stream": True,
-                                    "system": system,
-                                    "temperature": temperature,
-                                    "top_k": top_k,
-                                    "top_p": top_p,
-
-                                }) as response:
-                    for data in response.iter_lines():
-                        if data:
-                            # Parse the concatenated JSON string
+                                    content=_encode_body(body),
+                                    extensions=http_trace(observer=self._warmer.request_observer())) as response:
+                for data in response.iter_lines():
+                    if data:
+                        # Parse the concatenated JSON string
+                        with stage("stream_decode"):
                             parsed_objects = parse_concatenated_json(data)
+                        if isinstance(parsed_objects, dict):
+                            parsed_objects = [parsed_objects]
 
-                            # Do something with the parsed objects (for demonstration, just print them)
-                            for obj in parsed_objects:
-                                with MessageStreamManager(obj["data"]) as msg:
-                                    yield msg
+                        for obj in parsed_objects:
+                            event = state.filter(obj["data"])
+                            if event is None:
+                                continue
+                            with stage("build_events"):
+                                manager = MessageStreamManager(event)
+                            with manager as msg:
+                                yield msg
                     
           
          
         
         
     class AsyncClient:
-        def __init__(self, api_key: str, base_url: str, default_headers: str = ""):
+        def __init__(
+            self,
+            api_key: str,
+            base_url: str,
+            default_headers: str = "",
+            scheduler: Optional[RequestScheduler] = None,
+            cache: Optional[NearDuplicateCache] = None,
+        ):
             headers = {"Content-Type": "application/json", "X-API-Key": api_key}
             self._post =  httpx.AsyncClient(headers=headers, timeout=DEFAULT_TIMEOUT)
             self.url = base_url
+            self.scheduler = scheduler
+            self.cache = cache
+
+        def _slot(self, priority: Optional[str], deadline: Optional[float]):
+            if self.scheduler is None:
+                return _null_async_slot()
+            return self.scheduler.aacquire(priority, deadline)
 
         async def create(
             self,
@@ -140,24 +356,48 @@ class ProdPADLM_API:
             top_k: int = 0,
             top_p: float = 0,
             stream: bool = False,
+            priority: Optional[str] = None,
+            deadline: Optional[float] = None,
         ) -> Message:
-            async with self._post as client:
-                response = await client.post(
-                self.url + "/api/v1/generate",
-                json={
-                    "max_tokens": max_tokens,
-                    "messages": messages,
-                    "model": model,
-                    "stop_sequences": stop_sequences,
-                    "stream": stream,
-                    "system": system,
-                    "temperature": temperature,
-                    "top_k": top_k,
-                    "top_p": top_p,
-                },
-            )
-            resp=json.loads(response.read())
-            parsed_resp = Message(**resp)
+            cache_params = {
+                "max_tokens": max_tokens,
+                "model": model,
+                "stop_sequences": stop_sequences,
+                "temperature": temperature,
+                "top_k": top_k,
+                "top_p": top_p,
+            }
+            prepared = None
+            if self.cache is not None:
+                # signing a long prompt is CPU-bound; keep it off the event loop
+                prepared = await asyncio.to_thread(
+                    self.cache.prepare, system, messages, **cache_params
+                )
+                cached = self.cache.lookup(system, messages, prepared=prepared)
+                if cached is not None:
+                    return cached
+            async with self._slot(priority, deadline):
+                async with self._post as client:
+                    response = await client.post(
+                    self.url + "/api/v1/generate",
+                    content=_encode_body({
+                        "max_tokens": max_tokens,
+                        "messages": messages,
+                        "model": model,
+                        "stop_sequences": stop_sequences,
+                        "stream": stream,
+                        "system": system,
+                        "temperature": temperature,
+                        "top_k": top_k,
+                        "top_p": top_p,
+                    }),
+                    extensions=http_trace(is_async=True),
+                )
+                with stage("parse_response"):
+                    resp=json.loads(response.read())
+                    parsed_resp = Message(**resp)
+            if self.cache is not None:
+                self.cache.store(system, messages, parsed_resp, prepared=prepared)
             return parsed_resp
 
         async def stream(
@@ -171,27 +411,35 @@ class ProdPADLM_API:
             temperature: float = 0.7,
             top_k: int = 0,
             top_p: float = 0,
+            priority: Optional[str] = None,
+            deadline: Optional[float] = None,
         ) -> Message:
-            async with self._post as client:
-                with client.stream("POST", self.url + "/api/v1/generate",
-                                    json={
-                                    "max_tokens": max_tokens,
-                                    "messages": messages,
-                                    "model": model,
-                                    "stop_sequences": stop_sequences,
-                                    "stream": True,
-                                    "system": system,
-                                    "temperature": temperature,
-                                    "top_k": top_k,
-                                    "top_p": top_p,
-
-                                }) as response:
-                    async for data in response.aiter_lines():
-                        if data:
-                            # Parse the concatenated JSON string
-                            parsed_objects = parse_concatenated_json(data)
+            async with self._slot(priority, deadline):
+                async with self._post as client:
+                    async with client.stream("POST", self.url + "/api/v1/generate",
+                                        content=_encode_body({
+                                        "max_tokens": max_tokens,
+                                        "messages": messages,
+                                        "model": model,
+                                        "stop_sequences": stop_sequences,
+                                        "stream": True,
+                                        "system": system,
+                                        "temperature": temperature,
+                                        "top_k": top_k,
+                                        "top_p": top_p,
+
+                                    }),
+                                        extensions=http_trace(is_async=True)) as response:
+                        async for data in response.aiter_lines():
+                            if data:
+                                # Parse the concatenated JSON string
+                                with stage("stream_decode"):
+                                    parsed_objects = parse_concatenated_json(data)
+                                if isinstance(parsed_objects, dict):
+                                    parsed_objects = [parsed_objects]
 
-                            # Do something with the parsed objects (for demonstration, just print them)
-                            for obj in parsed_objects:
-                                with MessageStreamManager(obj["data"]) as msg:
-                                    yield msg
\ No newline at end of file
+                                for obj in parsed_objects:
+                                    with stage("build_events"):
+                                        manager = MessageStreamManager(obj["data"])
+                                    with manager as msg:
+                                        yield msg
@@ -0,0 +1,205 @@
+import asyncio
+import inspect
+import json
+import math
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from prodpadlm_client.resources._content import content_text
+
+__all__ = [
+    "TokenEstimator",
+    "HeuristicTokenEstimator",
+    "TokenizerFileEstimator",
+    "ContextBudgeter",
+]
+
+# tokens added per message for role markers and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenEstimator(ABC):
+    """Base class for local token counters.
+
+    Subclasses implement `count_text`; per-message counts are cached so that
+    long conversations are only measured once per turn.
+    """
+
+    def __init__(self, cache_size: int = 4096):
+        self.cache_size = cache_size
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def count_text(self, text: str) -> int:
+        """Return the estimated token count of ``text``."""
+
+    def count_message(self, message: Dict) -> int:
+        """Return the estimated token count of one formatted message."""
+        key = json.dumps(message, sort_keys=True, default=str)
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                return self._counts[key]
+        count = self.count_text(content_text(message.get("content"))) + MESSAGE_OVERHEAD_TOKENS
+        with self._lock:
+            self._counts[key] = count
+            if len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return count
+
+    def count_prompt(self, system: Optional[str], messages: List[Dict]) -> int:
+        total = sum(self.count_message(m) for m in messages)
+        if system:
+            total += self.count_text(system) + MESSAGE_OVERHEAD_TOKENS
+        return total
+
+
+class HeuristicTokenEstimator(TokenEstimator):
+    """Estimate tokens from character and word counts; errs on the high side."""
+
+    def __init__(self, chars_per_token: float = 4.0, tokens_per_word: float = 1.3, **kwargs):
+        super().__init__(**kwargs)
+        self.chars_per_token = chars_per_token
+        self.tokens_per_word = tokens_per_word
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        by_chars = len(text) / self.chars_per_token
+        by_words = len(text.split()) * self.tokens_per_word
+        return math.ceil(max(by_chars, by_words))
+
+
+class TokenizerFileEstimator(TokenEstimator):
+    """Count tokens exactly with a Hugging Face ``tokenizer.json`` file.
+
+    Requires the optional ``tokenizers`` package.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "TokenizerFileEstimator requires the tokenizers package: "
+                "pip install tokenizers"
+            ) from e
+        self._tokenizer = Tokenizer.from_file(path)
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def _has_block(message: Dict, block_type: str) -> bool:
+    content = message.get("content")
+    return isinstance(content, list) and any(
+        isinstance(block, dict) and block.get("type") == block_type for block in content
+    )
+
+
+def _split_turns(messages: List[Dict]) -> List[List[Dict]]:
+    """Group messages into turns, each starting at a user message.
+
+    A user message that carries ``tool_result`` blocks stays in the turn of the
+    assistant ``tool_use`` it answers, so the pair is never separated.
+    """
+    turns: List[List[Dict]] = []
+    for message in messages:
+        starts_turn = message["role"] == "user" and not _has_block(message, "tool_result")
+        if starts_turn or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+Summarizer = Callable[[List[Dict]], Union[str, Awaitable[str]]]
+
+
+class ContextBudgeter:
+    """Fit ``system`` + ``messages`` + ``max_tokens`` into a context window.
+
+    Whole turns are dropped starting from the oldest until the prompt fits; the
+    most recent turn is always kept. If a ``summarizer`` is given, it is called
+    once with the dropped messages and its summary is appended to the system
+    prompt, unless the summary itself would overflow the window, in which case
+    the trimmed prompt is sent without it.
+    A prompt whose latest turn alone cannot fit raises `ValueError` instead of
+    being sent.
+
+    ``summarizer`` may be a plain function or a coroutine function. `fit` runs
+    either to completion in the calling thread, blocking it for as long as the
+    summary takes (often a model call), so it must not be called from a running
+    event loop. `afit`, used by non-streaming ``ainvoke``, awaits a coroutine
+    function and runs a plain one in a worker thread instead.
+    """
+
+    def __init__(
+        self,
+        context_window: int,
+        estimator: Optional[TokenEstimator] = None,
+        summarizer: Optional[Summarizer] = None,
+    ):
+        self.context_window = context_window
+        self.estimator = estimator or HeuristicTokenEstimator()
+        self.summarizer = summarizer
+
+    def _plan(
+        self, system: Optional[str], messages: List[Dict], max_tokens: int
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """Return ``(kept, dropped)`` for the fewest oldest turns that must go."""
+        budget = self.context_window - max_tokens
+        if self.estimator.count_prompt(system, messages) <= budget:
+            return messages, []
+
+        turns = _split_turns(messages)
+        for start in range(1, len(turns)):
+            kept = [m for turn in turns[start:] for m in turn]
+            if self.estimator.count_prompt(system, kept) <= budget:
+                return kept, [m for turn in turns[:start] for m in turn]
+
+        needed = self.estimator.count_prompt(system, turns[-1]) + max_tokens if turns else max_tokens
+        raise ValueError(
+            f"Prompt needs about {needed} tokens including max_tokens={max_tokens}, "
+            f"which exceeds the context window of {self.context_window} tokens."
+        )
+
+    def _with_summary(
+        self, system: Optional[str], kept: List[Dict], summary: str, max_tokens: int
+    ) -> Optional[str]:
+        summary = f"Summary of the earlier conversation:\n{summary}"
+        fitted_system = f"{system}\n\n{summary}" if system else summary
+        if self.estimator.count_prompt(fitted_system, kept) <= self.context_window - max_tokens:
+            return fitted_system
+        return system
+
+    def fit(
+        self, system: Optional[str], messages: List[Dict], max_tokens: int
+    ) -> Tuple[Optional[str], List[Dict]]:
+        kept, dropped = self._plan(system, messages, max_tokens)
+        if not dropped or self.summarizer is None:
+            return system, kept
+        if inspect.iscoroutinefunction(self.summarizer):
+            summary = asyncio.run(self.summarizer(dropped))
+        else:
+            summary = self.summarizer(dropped)
+        return self._with_summary(system, kept, summary, max_tokens), kept
+
+    async def afit(
+        self, system: Optional[str], messages: List[Dict], max_tokens: int
+    ) -> Tuple[Optional[str], List[Dict]]:
+        """Async counterpart of `fit`."""
+        kept, dropped = self._plan(system, messages, max_tokens)
+        if not dropped or self.summarizer is None:
+            return system, kept
+        if inspect.iscoroutinefunction(self.summarizer):
+            summary = await self.summarizer(dropped)
+        else:
+            summary = await asyncio.to_thread(self.summarizer, dropped)
+        return self._with_summary(system, kept, summary, max_tokens), kept
@@ -0,0 +1,257 @@
+import hashlib
+import heapq
+import json
+import random
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Sequence, Tuple
+
+from prodpadlm_client.client_types.messages import Message
+from prodpadlm_client.resources._content import content_text
+
+__all__ = ["NearDuplicateCache", "TIMESTAMP_NORMALIZERS"]
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_WHITESPACE = re.compile(r"\s+")
+
+Normalizer = Tuple[Pattern[str], str]
+
+# ISO dates with optional time/zone, then bare clock times, replaced by placeholders
+TIMESTAMP_NORMALIZERS: Tuple[Normalizer, ...] = (
+    (
+        re.compile(
+            r"\b\d{4}-\d{2}-\d{2}(?:[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:z|[+-]\d{2}:?\d{2})?)?\b"
+        ),
+        "<datetime>",
+    ),
+    (re.compile(r"\b\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?\b"), "<time>"),
+)
+
+
+def _normalize(text: str, normalizers: Sequence[Normalizer]) -> str:
+    text = text.lower()
+    for pattern, replacement in normalizers:
+        text = pattern.sub(replacement, text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def normalize_prompt(
+    system: Optional[str],
+    messages: Iterable[Dict],
+    normalizers: Sequence[Normalizer] = (),
+) -> Tuple[str, str]:
+    """Split the output of `_format_messages` into comparable ``(context, question)`` text.
+
+    ``question`` is the last user turn and anything after it; ``context`` is
+    the system prompt and every earlier turn. Case and runs of whitespace are
+    collapsed. Each ``(pattern, replacement)`` in ``normalizers`` is then
+    applied in order, e.g. `TIMESTAMP_NORMALIZERS` to ignore dates and clock
+    times. Other numbers are kept as they are, so prompts asking about
+    different quantities or ids never normalise alike.
+    """
+    turns = [f"{m['role']}: {content_text(m.get('content'))}" for m in messages]
+    roles = [m["role"] for m in messages]
+    split = len(roles) - roles[::-1].index("user") - 1 if "user" in roles else len(roles)
+    context = "\n".join([f"system: {system or ''}", *turns[:split]])
+    question = "\n".join(turns[split:])
+    return _normalize(context, normalizers), _normalize(question, normalizers)
+
+
+class NearDuplicateCache:
+    """Approximate response cache keyed on MinHash signatures of the prompt context.
+
+    The last user turn, which carries the question being asked, must match
+    exactly after normalisation, as must every non-prompt parameter (model,
+    max_tokens, temperature, ...). Only the context before it, i.e. the system
+    prompt and earlier turns, is compared approximately: it is split into word
+    shingles and summarised with a ``num_perm``-wide MinHash signature, which is
+    banded into an LSH table so that lookups only compare against likely
+    neighbours. A cached response is returned when the estimated Jaccard
+    similarity of the contexts reaches ``threshold``. At most ``max_entries``
+    responses are kept; the least recently used is evicted first.
+
+    Signing costs ``num_perm`` multiplies per shingle, so long contexts are
+    subsampled: only the ``max_shingles`` shingles with the smallest hashes are
+    signed. The sample is chosen the same way for every prompt, so contexts
+    that share most of their shingles also share most of their samples.
+
+    ``normalizers`` are extra ``(pattern, replacement)`` rewrites applied to the
+    prompt text; none are applied by default. Pass `TIMESTAMP_NORMALIZERS` to
+    treat prompts that differ only in embedded dates and times as identical.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        bands: int = 32,
+        shingle_size: int = 3,
+        max_entries: int = 1024,
+        seed: int = 1,
+        normalizers: Sequence[Normalizer] = (),
+        max_shingles: int = 256,
+    ):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1].")
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands.")
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1.")
+        if max_shingles < 1:
+            raise ValueError("max_shingles must be at least 1.")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self.normalizers = tuple(normalizers)
+        self.max_shingles = max_shingles
+
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[str, Tuple[int, ...], Message]]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], set] = {}
+        self._next_id = 0
+
+        self._lookups = 0
+        self._hits = 0
+        self._exact_hits = 0
+        self._similarity_sum = 0.0
+        self._evictions = 0
+
+    def _shingles(self, text: str) -> set:
+        words = text.split(" ")
+        if len(words) <= self.shingle_size:
+            return {text}
+        return {
+            " ".join(words[i : i + self.shingle_size])
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        """Return the MinHash signature of already-normalised ``text``."""
+        hashes = {
+            int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little")
+            for s in self._shingles(text)
+        }
+        if len(hashes) > self.max_shingles:
+            hashes = heapq.nsmallest(self.max_shingles, hashes)
+        return tuple(
+            min([(a * h + b) % _MERSENNE_PRIME for h in hashes]) & _MAX_HASH
+            for a, b in self._perms
+        )
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [
+            (band, signature[band * self.rows : (band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def prepare(
+        self, system: Optional[str], messages: Iterable[Dict], **params: Any
+    ) -> Tuple[str, Tuple[int, ...]]:
+        """Return the ``(exact_key, signature)`` used by `lookup` and `store`.
+
+        ``exact_key`` combines the parameters and the normalised last user turn;
+        ``signature`` is the MinHash of the context before it. Computing the
+        signature is the expensive part of both calls; callers that look up and
+        then store the same prompt should prepare it once and pass the result to
+        each as ``prepared``.
+        """
+        context, question = normalize_prompt(system, messages, self.normalizers)
+        exact_key = json.dumps([params, question], sort_keys=True, default=str)
+        return exact_key, self.signature(context)
+
+    def lookup(
+        self,
+        system: Optional[str],
+        messages: Iterable[Dict],
+        prepared: Optional[Tuple[str, Tuple[int, ...]]] = None,
+        **params: Any,
+    ) -> Optional[Message]:
+        """Return the closest cached response above the threshold, if any."""
+        exact_key, signature = prepared or self.prepare(system, messages, **params)
+        with self._lock:
+            self._lookups += 1
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+
+            best_id, best_similarity = None, 0.0
+            for entry_id in candidates:
+                entry_key, entry_signature, _ = self._entries[entry_id]
+                if entry_key != exact_key:
+                    continue
+                similarity = sum(
+                    x == y for x, y in zip(signature, entry_signature)
+                ) / self.num_perm
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None or best_similarity < self.threshold:
+                return None
+            self._entries.move_to_end(best_id)
+            self._hits += 1
+            self._similarity_sum += best_similarity
+            if best_similarity == 1.0:
+                self._exact_hits += 1
+            return self._entries[best_id][2]
+
+    def store(
+        self,
+        system: Optional[str],
+        messages: Iterable[Dict],
+        response: Message,
+        prepared: Optional[Tuple[str, Tuple[int, ...]]] = None,
+        **params: Any,
+    ) -> None:
+        """Index ``response`` under the prompt, evicting the oldest entry when full."""
+        exact_key, signature = prepared or self.prepare(system, messages, **params)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (exact_key, signature, response)
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        entry_id, (_, signature, _) = self._entries.popitem(last=False)
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+        self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit-rate and hit-quality counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "misses": self._lookups - self._hits,
+                "exact_hits": self._exact_hits,
+                "approximate_hits": self._hits - self._exact_hits,
+                "hit_rate": self._hits / self._lookups if self._lookups else 0.0,
+                "mean_hit_similarity": (
+                    self._similarity_sum / self._hits if self._hits else 0.0
+                ),
+                "evictions": self._evictions,
+            }
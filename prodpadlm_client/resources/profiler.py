@@ -0,0 +1,201 @@
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+__all__ = ["Profiler", "stage"]
+
+_active: ContextVar[Optional[Tuple["Profiler", int]]] = ContextVar(
+    "prodpadlm_profiler", default=None
+)
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("profiler", "request_id", "name", "start")
+
+    def __init__(self, profiler: "Profiler", request_id: int, name: str):
+        self.profiler = profiler
+        self.request_id = request_id
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler._record(self.request_id, self.name, self.start, time.perf_counter_ns())
+
+
+def stage(name: str):
+    """Time the enclosed block as ``name`` for the request being profiled, if any.
+
+    Returns a shared no-op context manager when profiling is not active.
+    """
+    active = _active.get()
+    if active is None:
+        return _NULL_STAGE
+    return _Stage(active[0], active[1], name)
+
+
+class _HttpTrace:
+    """Turn httpx/httpcore ``trace`` extension events into pipeline stages."""
+
+    _STAGES = {
+        "connection.connect_tcp": "connect",
+        "connection.start_tls": "connect",
+        "http11.send_request_headers": "network",
+        "http11.send_request_body": "network",
+        "http11.receive_response_headers": "network",
+        "http11.receive_response_body": "response_body",
+        "http2.send_request_headers": "network",
+        "http2.send_request_body": "network",
+        "http2.receive_response_headers": "network",
+        "http2.receive_response_body": "response_body",
+    }
+
+    def __init__(
+        self,
+        active: Optional[Tuple["Profiler", int]],
+        observer: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    ):
+        self.profiler, self.request_id = active or (None, 0)
+        self.observer = observer
+        self.requested = time.perf_counter_ns()
+        self.pool_acquired = False
+        self.started: Dict[str, int] = {}
+
+    def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        if self.observer is not None:
+            self.observer(event_name, info)
+        if self.profiler is None:
+            return
+        now = time.perf_counter_ns()
+        if not self.pool_acquired:
+            # the first transport event marks the moment a pooled connection was handed out
+            self.pool_acquired = True
+            self.profiler._record(self.request_id, "pool_acquire", self.requested, now)
+        event, _, phase = event_name.rpartition(".")
+        if event not in self._STAGES:
+            return
+        if phase == "started":
+            self.started[event] = now
+        elif phase in ("complete", "failed") and event in self.started:
+            self.profiler._record(
+                self.request_id, self._STAGES[event], self.started.pop(event), now
+            )
+
+    async def async_call(self, event_name: str, info: Dict[str, Any]) -> None:
+        self(event_name, info)
+
+
+def http_trace(
+    is_async: bool = False,
+    observer: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+) -> Optional[Dict[str, Callable]]:
+    """Return httpx ``extensions`` that time connection stages, or None when disabled.
+
+    ``observer``, if given, receives every raw trace event whether or not a
+    profiler is active.
+    """
+    active = _active.get()
+    if active is None and observer is None:
+        return None
+    trace = _HttpTrace(active, observer)
+    return {"trace": trace.async_call if is_async else trace}
+
+
+class Profiler:
+    """Opt-in, per-request timing of the request pipeline.
+
+    Stages are timed only inside `profile`, which binds the profiler to the
+    current context, so work done elsewhere pays a single context variable
+    lookup per stage. Recorded stages include ``format_messages``,
+    ``merge_messages``, ``json_encode``, ``pool_acquire``, ``connect``,
+    ``network``, ``response_body``, ``parse_response``, ``stream_decode``,
+    ``build_events`` and ``callbacks``. ``callbacks`` covers only the
+    ``on_llm_new_token`` handlers run while streaming; ``on_llm_start`` and
+    ``on_llm_end`` are invoked by LangChain outside this client and fall
+    within the enclosing `profile` block but not any stage.
+
+    Example:
+        profiler = Profiler()
+        with profiler.profile("chat"):
+            model.invoke(messages)
+        print(profiler.totals())
+        profiler.export_chrome_trace("trace.json")  # open in Perfetto
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._origin = time.perf_counter_ns()
+        self._requests: Dict[int, str] = {}
+        self._events: List[Tuple[int, str, int, int, int]] = []
+
+    @contextmanager
+    def profile(self, label: str = "request"):
+        """Profile everything run in the current context until the block exits."""
+        request_id = next(self._ids)
+        with self._lock:
+            self._requests[request_id] = label
+        token = _active.set((self, request_id))
+        try:
+            with stage(label):
+                yield request_id
+        finally:
+            _active.reset(token)
+
+    def _record(self, request_id: int, name: str, start: int, end: int) -> None:
+        event = (request_id, name, start, end, threading.get_ident())
+        with self._lock:
+            self._events.append(event)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._requests.clear()
+            self._events.clear()
+
+    def totals(self) -> Dict[str, Dict[str, float]]:
+        """Return call count and total/mean milliseconds per stage across all requests."""
+        with self._lock:
+            events = list(self._events)
+        totals: Dict[str, Dict[str, float]] = {}
+        for _, name, start, end, _ in events:
+            entry = totals.setdefault(name, {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += (end - start) / 1e6
+        for entry in totals.values():
+            entry["mean_ms"] = entry["total_ms"] / entry["count"]
+        return totals
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Return the recorded stages in Chrome ``trace_event`` format."""
+        with self._lock:
+            events = list(self._events)
+            requests = dict(self._requests)
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "cat": "prodpadlm",
+                    "ph": "X",
+                    "ts": (start - self._origin) / 1e3,
+                    "dur": (end - start) / 1e3,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"request_id": request_id, "request": requests.get(request_id)},
+                }
+                for request_id, name, start, end, tid in sorted(events, key=lambda e: e[2])
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def export_chrome_trace(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
@@ -0,0 +1,104 @@
+from typing import Any, Dict, Optional, Set
+
+__all__ = ["StreamResumeError", "StreamResumeState"]
+
+
+class StreamResumeError(RuntimeError):
+    """Raised when a reconnected stream cannot be spliced onto the text already delivered."""
+
+
+class StreamResumeState:
+    """Tracks a streamed message so it can be resumed after a dropped connection.
+
+    The message id comes from ``message_start`` and ``offset`` counts the text
+    characters already delivered to the consumer. A resume request sends both
+    to the server as ``{"resume": {"message_id": ..., "offset": ...}}``. The
+    resumed stream must open with a ``message_start`` for the same message id
+    whose ``message.resumed_from`` says where the server actually restarted;
+    any text replayed before ``offset`` is dropped, as are repeated start/stop
+    events, so the consumer sees a single uninterrupted stream. A resumed
+    stream that does not confirm this, e.g. a server that ignored ``resume``
+    and started a new generation, raises `StreamResumeError` rather than being
+    spliced onto the old text.
+    """
+
+    def __init__(self):
+        self.message_id: Optional[str] = None
+        self.offset = 0
+        self.resumes = 0
+        self._message_started = False
+        self._started_blocks: Set[int] = set()
+        self._stopped_blocks: Set[int] = set()
+        self._skip = 0
+        self._awaiting_resume = False
+
+    @property
+    def can_resume(self) -> bool:
+        """True if a retry will not repeat events the consumer has already seen."""
+        return self.message_id is not None or not self._message_started
+
+    def resume_request(self) -> Optional[Dict[str, Any]]:
+        if self.message_id is None:
+            return None
+        return {"message_id": self.message_id, "offset": self.offset}
+
+    def mark_resumed(self) -> None:
+        self.resumes += 1
+        self._skip = 0
+        self._awaiting_resume = self._message_started
+
+    def _check_resume(self, message: Dict[str, Any]) -> None:
+        if message.get("id") != self.message_id:
+            raise StreamResumeError(
+                f"Resumed stream is for message {message.get('id')!r}, "
+                f"expected {self.message_id!r}; the server did not resume."
+            )
+        resumed_from = message.get("resumed_from")
+        if not isinstance(resumed_from, int) or not 0 <= resumed_from <= self.offset:
+            raise StreamResumeError(
+                f"Resumed stream reported resumed_from={resumed_from!r}; "
+                f"expected an offset between 0 and {self.offset}."
+            )
+
+    def filter(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return ``event`` as it should reach the consumer, or None to drop it."""
+        event_type = event.get("type")
+        if self._awaiting_resume and event_type not in ("message_start", "ping"):
+            raise StreamResumeError(
+                f"Resumed stream sent {event_type!r} before confirming the resume."
+            )
+        if event_type == "message_start":
+            message = event.get("message") or {}
+            if self._message_started:
+                self._check_resume(message)
+                self._awaiting_resume = False
+                self._skip = self.offset - message["resumed_from"]
+                return None
+            self._message_started = True
+            self.message_id = message.get("id")
+            return event
+        if event_type == "content_block_start":
+            if event.get("index") in self._started_blocks:
+                return None
+            self._started_blocks.add(event.get("index"))
+            return event
+        if event_type == "content_block_stop":
+            if event.get("index") in self._stopped_blocks:
+                return None
+            self._stopped_blocks.add(event.get("index"))
+            return event
+        if event_type == "content_block_delta":
+            delta = event.get("delta") or {}
+            if delta.get("type") != "text_delta":
+                return event
+            text = delta.get("text", "")
+            if self._skip:
+                dropped = min(self._skip, len(text))
+                self._skip -= dropped
+                text = text[dropped:]
+                if not text:
+                    return None
+                event = {**event, "delta": {**delta, "text": text}}
+            self.offset += len(text)
+            return event
+        return event
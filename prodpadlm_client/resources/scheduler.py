@@ -0,0 +1,205 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, List, Mapping, Optional
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+
+# priority classes in order of precedence, mapped to their guaranteed concurrency share
+DEFAULT_PRIORITY_SHARES = {PRIORITY_INTERACTIVE: 8, PRIORITY_BATCH: 2}
+
+__all__ = [
+    "PRIORITY_INTERACTIVE",
+    "PRIORITY_BATCH",
+    "RequestDeadlineExceeded",
+    "RequestScheduler",
+]
+
+
+class RequestDeadlineExceeded(TimeoutError):
+    """Raised when a request's deadline passes before it could be sent."""
+
+
+class _Waiter:
+    __slots__ = ("priority", "expires_at", "granted", "expired", "cancelled", "wake")
+
+    def __init__(self, priority: str, expires_at: Optional[float], wake: Callable[[], None]):
+        self.priority = priority
+        self.expires_at = expires_at
+        self.granted = False
+        self.expired = False
+        self.cancelled = False
+        self.wake = wake
+
+
+class RequestScheduler:
+    """Client-side admission control for `create`/`stream` calls.
+
+    No more than ``max_concurrency`` requests run in total; it defaults to the
+    sum of ``shares``. Whenever a slot frees up, it goes first to a class that
+    has fewer than ``shares[priority]`` requests in flight, so every class keeps
+    making progress under sustained load from the others. Capacity no class is
+    owed is lent out, so a class may run beyond its share while the others are
+    idle. Classes are served in the order they appear in ``shares`` and, within
+    a class, the request with the earliest deadline goes first. Requests whose
+    deadline has passed are dropped with `RequestDeadlineExceeded` before they
+    are sent.
+    """
+
+    def __init__(
+        self,
+        shares: Optional[Mapping[str, int]] = None,
+        max_concurrency: Optional[int] = None,
+        default_priority: Optional[str] = None,
+    ):
+        self.shares: Dict[str, int] = dict(shares or DEFAULT_PRIORITY_SHARES)
+        if not self.shares:
+            raise ValueError("At least one priority class is required.")
+        if any(share < 1 for share in self.shares.values()):
+            raise ValueError("Priority shares must be positive integers.")
+        self.priorities: List[str] = list(self.shares)
+        self.max_concurrency = max_concurrency or sum(self.shares.values())
+        self.default_priority = default_priority or self.priorities[0]
+        if self.default_priority not in self.shares:
+            raise ValueError(f"Unknown priority class: {self.default_priority}")
+
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._queues: Dict[str, list] = {p: [] for p in self.priorities}
+        self._in_flight: Dict[str, int] = {p: 0 for p in self.priorities}
+        self._dropped: Dict[str, int] = {p: 0 for p in self.priorities}
+        self._total = 0
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return in-flight, queued and dropped counts per priority class."""
+        with self._lock:
+            return {
+                p: {
+                    "in_flight": self._in_flight[p],
+                    "queued": sum(1 for *_, w in self._queues[p] if not w.cancelled),
+                    "dropped": self._dropped[p],
+                }
+                for p in self.priorities
+            }
+
+    def _enqueue(
+        self, priority: Optional[str], deadline: Optional[float], wake: Callable[[], None]
+    ) -> _Waiter:
+        priority = priority or self.default_priority
+        if priority not in self.shares:
+            raise ValueError(f"Unknown priority class: {priority}")
+        expires_at = None if deadline is None else time.monotonic() + deadline
+        waiter = _Waiter(priority, expires_at, wake)
+        key = float("inf") if expires_at is None else expires_at
+        with self._lock:
+            heapq.heappush(self._queues[priority], (key, next(self._seq), waiter))
+            woken = self._dispatch_locked()
+        self._wake_all(woken)
+        return waiter
+
+    def _dispatch_locked(self) -> List[_Waiter]:
+        now = time.monotonic()
+        woken = []
+        # fill each class up to its share first, then lend out what is left
+        for borrowing in (False, True):
+            for priority in self.priorities:
+                queue = self._queues[priority]
+                while (
+                    queue
+                    and self._total < self.max_concurrency
+                    and (borrowing or self._in_flight[priority] < self.shares[priority])
+                ):
+                    *_, waiter = heapq.heappop(queue)
+                    if waiter.cancelled:
+                        continue
+                    if waiter.expires_at is not None and waiter.expires_at <= now:
+                        waiter.expired = True
+                        self._dropped[priority] += 1
+                    else:
+                        waiter.granted = True
+                        self._in_flight[priority] += 1
+                        self._total += 1
+                    woken.append(waiter)
+        return woken
+
+    @staticmethod
+    def _wake_all(woken: List[_Waiter]) -> None:
+        for waiter in woken:
+            waiter.wake()
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Withdraw a waiter that stopped waiting. Returns True if it was granted meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            if not waiter.expired:
+                waiter.cancelled = True
+                waiter.expired = True
+                self._dropped[waiter.priority] += 1
+            return False
+
+    def _release(self, waiter: _Waiter) -> None:
+        with self._lock:
+            self._in_flight[waiter.priority] -= 1
+            self._total -= 1
+            woken = self._dispatch_locked()
+        self._wake_all(woken)
+
+    @staticmethod
+    def _remaining(waiter: _Waiter) -> Optional[float]:
+        if waiter.expires_at is None:
+            return None
+        return max(waiter.expires_at - time.monotonic(), 0.0)
+
+    @contextmanager
+    def acquire(self, priority: Optional[str] = None, deadline: Optional[float] = None):
+        """Block until a slot for ``priority`` is free.
+
+        ``deadline`` is the number of seconds the request may wait before it is
+        dropped with `RequestDeadlineExceeded`.
+        """
+        event = threading.Event()
+        waiter = self._enqueue(priority, deadline, event.set)
+        event.wait(self._remaining(waiter))
+        if not waiter.granted and not self._abandon(waiter):
+            raise RequestDeadlineExceeded(
+                f"{waiter.priority} request dropped: deadline of {deadline}s exceeded"
+            )
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    @asynccontextmanager
+    async def aacquire(self, priority: Optional[str] = None, deadline: Optional[float] = None):
+        """Async counterpart of `acquire`."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def _set_result() -> None:
+            if not future.done():
+                future.set_result(None)
+
+        waiter = self._enqueue(
+            priority, deadline, lambda: loop.call_soon_threadsafe(_set_result)
+        )
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self._remaining(waiter))
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            if self._abandon(waiter):
+                self._release(waiter)
+            raise
+        if not waiter.granted and not self._abandon(waiter):
+            raise RequestDeadlineExceeded(
+                f"{waiter.priority} request dropped: deadline of {deadline}s exceeded"
+            )
+        try:
+            yield
+        finally:
+            self._release(waiter)
@@ -0,0 +1,225 @@
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from prodpadlm_client.resources.profiler import http_trace
+
+__all__ = ["ConnectionWarmer"]
+
+# probe threads to keep around when the pool size is unbounded
+DEFAULT_MAX_PROBES = 32
+
+
+class ConnectionWarmer:
+    """Pre-opens and keeps alive pooled connections for a sync `Client`.
+
+    `warmup` issues ``n`` overlapping lightweight ``HEAD`` probes, without the
+    API key, so the pool holds ``n`` connections with DNS, TCP and TLS already
+    done. `start` runs a daemon thread that checks the pool every ``interval``
+    seconds and probes only the shortfall: the number of connections, up to
+    ``min_idle``, that would otherwise not be warm at the next check. Real
+    traffic that keeps connections busy therefore suppresses probes. Probes
+    run on one long-lived executor that is shut down by `close`.
+
+    Connection counts come from the httpx ``trace`` events of requests made
+    through the client once ``tracking`` is on. It is off by default, so
+    requests pay nothing for it, and `warmup` and `start` turn it on: a TCP connect is a cold connect, counted separately for
+    real requests and for probes, and a closed response returns its connection
+    to the warm pool until ``keepalive_expiry`` passes. The warm-pool size is
+    therefore best-effort: connections the server closes, or that a custom
+    transport handles without emitting trace events, are not seen.
+
+    Whoever calls `start` owns the thread and should call `stop` when done; the
+    thread also exits on its own once the warmer is garbage collected.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        probe_path: str = "",
+        keepalive_expiry: Optional[float] = 5.0,
+        max_keepalive: Optional[int] = None,
+    ):
+        self._client = client
+        self.probe_path = probe_path
+        self.keepalive_expiry = keepalive_expiry
+        self.max_keepalive = max_keepalive
+        self._lock = threading.Lock()
+        self._idle_since: List[float] = []
+        self._request_cold_connects = 0
+        self._probe_cold_connects = 0
+        self._probes = 0
+        self._probe_failures = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.tracking = False
+        self._max_probes = max_keepalive or DEFAULT_MAX_PROBES
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _prune_locked(self, now: float) -> None:
+        if self.keepalive_expiry is not None:
+            cutoff = now - self.keepalive_expiry
+            self._idle_since = [t for t in self._idle_since if t > cutoff]
+        if self.max_keepalive is not None:
+            del self._idle_since[: max(len(self._idle_since) - self.max_keepalive, 0)]
+
+    def observer(self, probe: bool = False) -> Callable[[str, Dict[str, Any]], None]:
+        """Return an httpx trace observer for one request."""
+        connected = False
+        acquired = False
+
+        def observe(event_name: str, info: Dict[str, Any]) -> None:
+            nonlocal connected, acquired
+            if event_name == "connection.connect_tcp.complete":
+                connected = True
+                with self._lock:
+                    if probe:
+                        self._probe_cold_connects += 1
+                    else:
+                        self._request_cold_connects += 1
+            elif event_name.endswith(".send_request_headers.started") and not acquired:
+                acquired = True
+                if not connected:
+                    # no connect for this request: it took a warm connection
+                    with self._lock:
+                        self._prune_locked(time.monotonic())
+                        if self._idle_since:
+                            self._idle_since.pop()
+            elif event_name.endswith(".response_closed.complete"):
+                with self._lock:
+                    self._idle_since.append(time.monotonic())
+                    self._prune_locked(time.monotonic())
+
+        return observe
+
+    def request_observer(self) -> Optional[Callable[[str, Dict[str, Any]], None]]:
+        """Return an observer for one client request, or None while not tracking."""
+        return self.observer() if self.tracking else None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_probes, thread_name_prefix="prodpadlm-warmup"
+                )
+            return self._executor
+
+    def _probe(self, barrier: threading.Barrier) -> None:
+        post = self._client._post
+        request = post.build_request(
+            "HEAD",
+            self._client.url + self.probe_path,
+            extensions=http_trace(observer=self.observer(probe=True)),
+        )
+        request.headers.pop("X-API-Key", None)
+        try:
+            response = post.send(request, stream=True)
+            try:
+                # hold the connection until every probe has one, so no two share it
+                barrier.wait(timeout=post.timeout.connect)
+            except threading.BrokenBarrierError:
+                pass
+            finally:
+                # reading to the end hands the connection back to the pool open
+                response.read()
+        except httpx.HTTPError:
+            barrier.abort()
+            with self._lock:
+                self._probe_failures += 1
+        else:
+            with self._lock:
+                self._probes += 1
+
+    def _run_probes(self, n: int) -> None:
+        n = min(n, self._max_probes)
+        if n <= 0:
+            return
+        barrier = threading.Barrier(n)
+        executor = self._get_executor()
+        wait([executor.submit(self._probe, barrier) for _ in range(n)])
+
+    def warmup(self, n: int) -> int:
+        """Open up to ``n`` connections concurrently; returns the warm pool size."""
+        self.tracking = True
+        self._run_probes(n)
+        return self.warm_connections()
+
+    def _shortfall(self, min_idle: int, interval: float) -> int:
+        """Connections to probe so ``min_idle`` stay warm until ``interval`` from now."""
+        now = time.monotonic()
+        with self._lock:
+            self._prune_locked(now)
+            if self.keepalive_expiry is None:
+                lasting = len(self._idle_since)
+            else:
+                horizon = now + interval - self.keepalive_expiry
+                lasting = sum(1 for t in self._idle_since if t > horizon)
+        return max(min_idle - lasting, 0)
+
+    def warm_connections(self) -> int:
+        """Best-effort number of idle, reusable connections in the pool."""
+        with self._lock:
+            self._prune_locked(time.monotonic())
+            return len(self._idle_since)
+
+    def start(self, min_idle: int, interval: Optional[float] = None) -> None:
+        """Keep ``min_idle`` connections warm from a background thread.
+
+        ``interval`` defaults to half of ``keepalive_expiry`` so probes land
+        before idle connections are dropped.
+        """
+        self.stop()
+        self.tracking = True
+        if interval is None:
+            interval = (self.keepalive_expiry or 5.0) / 2
+        self._stop = threading.Event()
+        # the thread only holds a weak reference so it never keeps the client alive
+        warmer_ref = weakref.ref(self)
+
+        def run(stop: threading.Event) -> None:
+            while not stop.wait(interval):
+                warmer = warmer_ref()
+                if warmer is None:
+                    return
+                warmer._run_probes(warmer._shortfall(min_idle, interval))
+                del warmer
+
+        self._thread = threading.Thread(
+            target=run, args=(self._stop,), name="prodpadlm-keepalive", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def close(self) -> None:
+        """Stop the keep-alive thread and shut down the probe executor."""
+        self.stop()
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def __del__(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        warm = self.warm_connections()
+        with self._lock:
+            return {
+                "warm_connections": warm,
+                "request_cold_connects": self._request_cold_connects,
+                "probe_cold_connects": self._probe_cold_connects,
+                "probes": self._probes,
+                "probe_failures": self._probe_failures,
+                "keepalive_running": self._thread is not None,
+            }
@@ -1,9 +1,30 @@
+import asyncio
+import gc
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
 import pytest
 from prodpadlm_client.client_types.messages import Message, TextBlock, Usage
 from prodpadlm_client.resources.api import ProdPADLM_API, MessageParam
 from prodpadlm_client.client_types.messages import Message
 from prodpadlm_client.client import ProdPadLMChat, _format_messages
-from langchain_core.messages import HumanMessage, BaseMessage
+from prodpadlm_client.resources import profiler as profiler_module
+from prodpadlm_client.resources.budget import (
+    ContextBudgeter,
+    HeuristicTokenEstimator,
+    TokenEstimator,
+)
+from prodpadlm_client.resources.cache import NearDuplicateCache, TIMESTAMP_NORMALIZERS
+from prodpadlm_client.resources.profiler import Profiler
+from prodpadlm_client.resources.resume import StreamResumeError, StreamResumeState
+from prodpadlm_client.resources.scheduler import RequestDeadlineExceeded, RequestScheduler
+from langchain_core.messages import AIMessage, HumanMessage, BaseMessage, ToolMessage
 
 def test_message_creation():
     text_block = TextBlock(text="Hello, world!", type="text")
@@ -72,3 +93,718 @@ def test_format_params():
     assert params["stop_sequences"] == ["stop"]
     assert params["system"] is None
     assert params["messages"] == _format_messages(messages)
+
+
+def _message_json(text="Hi"):
+    return {
+        "id": "msg_1",
+        "content": [{"type": "text", "text": text}],
+        "model": "test_model",
+        "role": "assistant",
+        "stop_reason": "end_turn",
+        "type": "message",
+        "usage": {"input_tokens": 1, "output_tokens": 1},
+    }
+
+
+def _echo_message(request):
+    return _message_json(json.loads(request.content)["messages"][0]["content"])
+
+
+def _mock_http(reply=None):
+    """httpx client answering every request with ``reply(request)``.
+
+    A dict reply is sent as a JSON body; without ``reply`` a fixed message is returned.
+    """
+    def handler(request):
+        result = reply(request) if reply else _message_json()
+        return result if isinstance(result, httpx.Response) else httpx.Response(200, json=result)
+
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def test_scheduler_serves_interactive_before_batch():
+    scheduler = RequestScheduler(max_concurrency=1)
+    order = []
+
+    def run(priority):
+        with scheduler.acquire(priority):
+            order.append(priority)
+
+    with scheduler.acquire("batch"):
+        batch = threading.Thread(target=run, args=("batch",))
+        batch.start()
+        while scheduler.stats()["batch"]["queued"] != 1:
+            time.sleep(0.001)
+        interactive = threading.Thread(target=run, args=("interactive",))
+        interactive.start()
+        while scheduler.stats()["interactive"]["queued"] != 1:
+            time.sleep(0.001)
+    batch.join()
+    interactive.join()
+
+    assert order == ["interactive", "batch"]
+
+
+def test_scheduler_drops_expired_requests():
+    scheduler = RequestScheduler(max_concurrency=1)
+    with scheduler.acquire("interactive"):
+        with pytest.raises(RequestDeadlineExceeded):
+            with scheduler.acquire("batch", deadline=0.05):
+                pass
+
+    assert scheduler.stats()["batch"] == {"in_flight": 0, "queued": 0, "dropped": 1}
+
+
+def test_scheduler_lends_idle_capacity_without_starving_batch():
+    scheduler = RequestScheduler()
+    assert scheduler.max_concurrency == 10
+
+    # with no interactive traffic, batch borrows far beyond its share of 2
+    with ExitStack() as stack:
+        for _ in range(10):
+            stack.enter_context(scheduler.acquire("batch"))
+        assert scheduler.stats()["batch"]["in_flight"] == 10
+
+    def run(priority):
+        with scheduler.acquire(priority):
+            pass
+
+    # interactive fills every slot and keeps more queued; the next free slot goes to batch
+    slots = [scheduler.acquire("interactive") for _ in range(10)]
+    for slot in slots:
+        slot.__enter__()
+    threads = [threading.Thread(target=run, args=(p,)) for p in ["interactive"] * 5 + ["batch"]]
+    for thread in threads:
+        thread.start()
+    while scheduler.stats()["interactive"]["queued"] != 5 or scheduler.stats()["batch"]["queued"] != 1:
+        time.sleep(0.001)
+    slots.pop().__exit__(None, None, None)
+    stats = scheduler.stats()
+    assert stats["batch"]["queued"] == 0 and stats["interactive"]["queued"] == 5
+
+    for slot in slots:
+        slot.__exit__(None, None, None)
+    for thread in threads:
+        thread.join()
+    assert scheduler.stats()["interactive"]["in_flight"] == 0
+
+
+def test_priority_passed_through_format_params():
+    scheduler = RequestScheduler()
+    chat = ProdPadLMChat(
+        prodpadlm_api_url="http://testurl.com",
+        prodpadlm_api_key="test_key",
+        scheduler=scheduler,
+    )
+    chat._client._post = _mock_http()
+
+    params = chat._format_params(messages=[HumanMessage(content="Hello")], priority="batch")
+    assert params["priority"] == "batch"
+
+    result = chat.invoke([HumanMessage(content="Hello")], priority="batch", deadline=5)
+    assert result.content == "Hi"
+    assert scheduler.stats()["batch"]["in_flight"] == 0
+
+
+def test_near_duplicate_cache_hits_on_similar_prompt():
+    calls = []
+
+    cache = NearDuplicateCache(threshold=0.8, normalizers=TIMESTAMP_NORMALIZERS)
+    client = ProdPADLM_API.Client(api_key="test_key", base_url="http://testurl.com", cache=cache)
+    client._post = _mock_http(lambda request: calls.append(request) or _message_json())
+
+    passage = " ".join(f"word{i}" for i in range(200))
+    question = [{"role": "user", "content": "What comes after word7?"}]
+    first = client.create(
+        max_tokens=10,
+        messages=question,
+        system=f"Answer from context retrieved at 2024-01-01 12:00 {passage}",
+    )
+    second = client.create(
+        max_tokens=10,
+        messages=[{"role": "user", "content": "what comes  after word7?"}],
+        system=f"Answer from context retrieved at  2024-06-30 09:15\n{passage} plus a few extra words the second retrieval added",
+    )
+    client.create(
+        max_tokens=20,
+        messages=question,
+        system=f"Answer from context retrieved at 2024-01-01 12:00 {passage}",
+    )
+
+    assert second is first
+    assert len(calls) == 2
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    assert 0.8 <= stats["mean_hit_similarity"] < 1
+
+
+def test_near_duplicate_cache_misses_when_only_the_question_differs():
+    cache = NearDuplicateCache()
+    passage = "\n".join(f"line {i} of the retrieved passage about european capitals" for i in range(100))
+    rag = [{"role": "user", "content": f"{passage}\nWhat is the capital of France?"}]
+    cache.store("Answer from context", rag, Message(**_message_json("Paris")), max_tokens=10)
+    assert cache.lookup("Answer from context", rag, max_tokens=10) is not None
+
+    rag[0]["content"] = rag[0]["content"].replace("France", "Spain")
+    assert cache.lookup("Answer from context", rag, max_tokens=10) is None
+
+    history = [
+        {"role": "user", "content": passage},
+        {"role": "assistant", "content": "I have read the passage."},
+        {"role": "user", "content": "Say yes"},
+    ]
+    cache.store(None, history, Message(**_message_json("yes")), max_tokens=10)
+    history[-1] = {"role": "user", "content": "Say no"}
+    assert cache.lookup(None, history, max_tokens=10) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_near_duplicate_cache_misses_when_numbers_differ():
+    cache = NearDuplicateCache(normalizers=TIMESTAMP_NORMALIZERS)
+    for prompt, other in (
+        ("What is 2 + 2?", "What is 317 + 9?"),
+        ("Show me order 555", "Show me order 12345"),
+        ("Refund order 555 placed at 2024-01-01 12:00", "Refund order 12345 placed at 2024-01-01 12:00"),
+    ):
+        cache.store(None, [{"role": "user", "content": prompt}], Message(**_message_json()), max_tokens=10)
+        assert cache.lookup(None, [{"role": "user", "content": other}], max_tokens=10) is None
+    assert cache.stats()["hits"] == 0
+
+
+def test_near_duplicate_cache_signs_prompt_once_per_miss(monkeypatch):
+    cache = NearDuplicateCache()
+    client = ProdPADLM_API.Client(api_key="test_key", base_url="http://testurl.com", cache=cache)
+    client._post = _mock_http()
+    signed = []
+    signature = cache.signature
+    monkeypatch.setattr(cache, "signature", lambda text: signed.append(text) or signature(text))
+
+    client.create(max_tokens=10, messages=[{"role": "user", "content": "Hello"}])
+    assert len(signed) == 1
+    client.create(max_tokens=10, messages=[{"role": "user", "content": "Hello"}])
+    assert len(signed) == 2 and cache.stats()["hits"] == 1
+
+
+def test_near_duplicate_cache_subsamples_long_contexts():
+    cache = NearDuplicateCache(max_shingles=64)
+    question = [{"role": "user", "content": "Summarise the passage."}]
+    passage = " ".join(f"word{i}" for i in range(20000))
+    cache.store(passage, question, Message(**_message_json()), max_tokens=10)
+
+    assert cache.lookup(passage + " one more sentence at the end", question, max_tokens=10)
+    other = " ".join(f"term{i}" for i in range(20000))
+    assert cache.lookup(other, question, max_tokens=10) is None
+
+
+def test_async_client_signs_prompt_off_the_event_loop(monkeypatch):
+    cache = NearDuplicateCache()
+    client = ProdPADLM_API.AsyncClient(api_key="test_key", base_url="http://testurl.com", cache=cache)
+    client._post = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json=_message_json()))
+    )
+    threads = []
+    prepare = cache.prepare
+    monkeypatch.setattr(
+        cache, "prepare",
+        lambda *args, **kwargs: threads.append(threading.get_ident()) or prepare(*args, **kwargs),
+    )
+
+    async def create():
+        reply = await client.create(max_tokens=10, messages=[{"role": "user", "content": "Hello"}])
+        return reply, threading.get_ident()
+
+    reply, loop_thread = asyncio.run(create())
+    assert reply.content[0].text == "Hi"
+    assert threads and loop_thread not in threads
+
+
+def test_near_duplicate_cache_evicts_least_recently_used():
+    cache = NearDuplicateCache(max_entries=2)
+    responses = []
+    for topic in ("apples", "rockets", "violins"):
+        message = [{"role": "user", "content": f"tell me a long story about {topic} please"}]
+        responses.append(Message(**_message_json(topic)))
+        cache.store(None, message, responses[-1], max_tokens=10)
+
+    first = [{"role": "user", "content": "tell me a long story about apples please"}]
+    last = [{"role": "user", "content": "tell me a long story about violins please"}]
+    assert cache.lookup(None, first, max_tokens=10) is None
+    assert cache.lookup(None, last, max_tokens=10) is responses[2]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_client_map_shares_pool_and_bounds_in_flight():
+    lock = threading.Lock()
+    in_flight = [0, 0]  # current, peak
+
+    def handler(request):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return _echo_message(request)
+
+    client = ProdPADLM_API.Client(api_key="test_key", base_url="http://testurl.com", max_workers=8)
+    client._post = _mock_http(handler)
+    requests = [
+        {"max_tokens": 10, "messages": [{"role": "user", "content": str(i)}]}
+        for i in range(20)
+    ]
+
+    ordered = [m.content[0].text for m in client.map(requests, max_in_flight=4)]
+    unordered = dict(
+        (i, m.content[0].text) for i, m in client.imap_unordered(requests, max_in_flight=4)
+    )
+    client.close()
+
+    assert ordered == [str(i) for i in range(20)]
+    assert unordered == {i: str(i) for i in range(20)}
+    assert 1 < in_flight[1] <= 4
+
+
+def test_parallel_map_returns_messages_in_order():
+    chat = ProdPadLMChat(
+        prodpadlm_api_url="http://testurl.com", prodpadlm_api_key="test_key", max_workers=3
+    )
+    assert chat._client.max_workers == 3
+    chat._client._post = _mock_http(_echo_message)
+
+    replies = list(chat.parallel_map([[HumanMessage(content=str(i))] for i in range(5)]))
+
+    assert [r.content for r in replies] == ["0", "1", "2", "3", "4"]
+
+
+def test_context_budgeter_drops_oldest_turns_without_splitting_tool_pairs():
+    filler = "lorem ipsum " * 40
+    history = [
+        HumanMessage(content="first question " + filler),
+        AIMessage(content="first answer " + filler),
+        HumanMessage(content="look it up"),
+        AIMessage(content=[{"type": "tool_use", "id": "t1", "name": "search", "input": {"q": filler}}]),
+        ToolMessage(content="search result " + filler, tool_call_id="t1"),
+        AIMessage(content="found it"),
+        HumanMessage(content="thanks, and now?"),
+    ]
+    budgeter = ContextBudgeter(context_window=500)
+    _, formatted = _format_messages(history)
+    system, fitted = budgeter.fit(None, formatted, max_tokens=100)
+
+    assert fitted[0]["content"] == "look it up"
+    assert fitted[-1] == formatted[-1]
+    tool_use_index = next(
+        i for i, m in enumerate(fitted)
+        if isinstance(m["content"], list) and m["content"][0]["type"] == "tool_use"
+    )
+    assert fitted[tool_use_index + 1]["content"][0]["type"] == "tool_result"
+
+    budgeter.summarizer = lambda dropped: f"{len(dropped)} earlier messages"
+    system, fitted = budgeter.fit("Be brief.", formatted, max_tokens=100)
+    assert system == "Be brief.\n\nSummary of the earlier conversation:\n2 earlier messages"
+
+
+def test_context_budgeter_rejects_prompt_that_cannot_fit():
+    estimator = HeuristicTokenEstimator()
+    chat = ProdPadLMChat(
+        prodpadlm_api_url="http://testurl.com",
+        prodpadlm_api_key="test_key",
+        max_tokens=100,
+        context_budgeter=ContextBudgeter(context_window=120, estimator=estimator),
+    )
+
+    with pytest.raises(ValueError, match="exceeds the context window"):
+        chat._format_params(messages=[HumanMessage(content="word " * 100)])
+    assert chat._format_params(messages=[HumanMessage(content="hi")])["messages"] == [
+        {"role": "user", "content": "hi"}
+    ]
+    assert len(estimator._counts) == 2
+
+
+def test_context_budgeter_summarizes_once_per_streamed_call():
+    summaries = []
+
+    def summarize(dropped):
+        summaries.append(dropped)
+        return "x " * 500 if len(summaries) > 1 else "earlier chat"
+
+    chat = ProdPadLMChat(
+        prodpadlm_api_url="http://testurl.com",
+        prodpadlm_api_key="test_key",
+        max_tokens=100,
+        streaming=True,
+        context_budgeter=ContextBudgeter(context_window=200, summarizer=summarize),
+    )
+    calls = []
+    chat._client._post = _mock_http(
+        lambda request: calls.append(json.loads(request.content))
+        or httpx.Response(200, text=_stream_events(["o", "k"]))
+    )
+    history = [HumanMessage(content="old " * 150), AIMessage(content="reply"), HumanMessage(content="new")]
+
+    assert chat.invoke(history).content == "ok"
+    assert len(summaries) == 1
+    assert calls[-1]["system"].endswith("earlier chat")
+
+    # a summary too large for the window is left out rather than re-summarised
+    chat.invoke(history)
+    assert len(summaries) == 2
+    assert calls[-1]["system"] == ""
+    assert calls[-1]["messages"] == [{"role": "user", "content": "new"}]
+
+
+def test_context_budgeter_summarizes_off_the_event_loop():
+    summarizer_threads = []
+
+    def summarize(dropped):
+        summarizer_threads.append(threading.get_ident())
+        return "earlier chat"
+
+    async def asummarize(dropped):
+        return "earlier chat, async"
+
+    history = [HumanMessage(content="old " * 150), AIMessage(content="reply"), HumanMessage(content="new")]
+    calls = []
+
+    async def invoke(chat):
+        chat._async_client._post = httpx.AsyncClient(
+            transport=httpx.MockTransport(
+                lambda request: calls.append(json.loads(request.content))
+                or httpx.Response(200, json=_message_json())
+            )
+        )
+        await chat.ainvoke(history)
+        return threading.get_ident()
+
+    for summarizer in (summarize, asummarize):
+        chat = ProdPadLMChat(
+            prodpadlm_api_url="http://testurl.com",
+            prodpadlm_api_key="test_key",
+            max_tokens=100,
+            context_budgeter=ContextBudgeter(context_window=200, summarizer=summarizer),
+        )
+        loop_thread = asyncio.run(invoke(chat))
+
+    assert summarizer_threads and loop_thread not in summarizer_threads
+    assert calls[0]["system"].endswith("earlier chat")
+    assert calls[1]["system"].endswith("earlier chat, async")
+    # the sync path runs an async summarizer to completion as well
+    assert chat._format_params(messages=history)["system"].endswith("earlier chat, async")
+
+
+def test_token_estimator_requires_count_text():
+    with pytest.raises(TypeError):
+        TokenEstimator()
+
+
+def _stream_events(text_chunks):
+    events = [{"type": "message_start", "message": {"id": "msg_1"}}]
+    events += [
+        {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": t}}
+        for t in text_chunks
+    ]
+    events.append({"type": "message_stop"})
+    return "".join(json.dumps({"data": e}) for e in events) + "\n"
+
+
+def test_profiler_records_pipeline_stages_and_exports_chrome_trace(tmp_path):
+    chat = ProdPadLMChat(
+        prodpadlm_api_url="http://testurl.com", prodpadlm_api_key="test_key", streaming=True
+    )
+    chat._client._post = _mock_http(
+        lambda request: httpx.Response(200, text=_stream_events(["Hel", "lo"]))
+    )
+    assert profiler_module.stage("format_messages") is profiler_module._NULL_STAGE
+
+    profiler = Profiler()
+    with profiler.profile("chat"):
+        result = chat.invoke([HumanMessage(content="Hello")])
+
+    assert result.content == "Hello"
+    totals = profiler.totals()
+    for name in ("chat", "format_messages", "merge_messages", "json_encode",
+                 "stream_decode", "build_events", "callbacks"):
+        assert totals[name]["count"] >= 1
+    assert totals["build_events"]["count"] == 4
+
+    path = tmp_path / "trace.json"
+    profiler.export_chrome_trace(str(path))
+    trace = json.loads(path.read_text())
+    assert {e["ph"] for e in trace["traceEvents"]} == {"X"}
+    assert all(e["args"]["request"] == "chat" for e in trace["traceEvents"])
+
+
+@pytest.fixture
+def local_server():
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, body=b""):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.server.probe_api_keys.add(self.headers.get("X-API-Key"))
+            self._reply()
+
+        def do_POST(self):
+            self.server.client_ports.add(self.client_address[1])
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            self._reply(json.dumps(_message_json(body["messages"][0]["content"])).encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.client_ports = set()
+    server.probe_api_keys = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_warmup_opens_connections_ahead_of_requests(local_server):
+    _, url = local_server
+    chat = ProdPadLMChat(prodpadlm_api_url=url, prodpadlm_api_key="test_key", warmup_connections=3)
+
+    assert chat.connection_stats()["warm_connections"] == 3
+    assert chat.connection_stats()["probe_cold_connects"] == 3
+    for _ in range(3):
+        chat._client.create(max_tokens=10, messages=[{"role": "user", "content": "Hello"}])
+    stats = chat.connection_stats()
+    chat.close()
+
+    assert stats["request_cold_connects"] == 0
+    assert stats["probe_cold_connects"] == 3
+    assert stats["warm_connections"] == 3
+
+
+def test_cold_connects_counted_for_requests_without_warmup(local_server):
+    server, url = local_server
+    untracked = ProdPADLM_API.Client(api_key="test_key", base_url=url)
+    untracked.create(max_tokens=10, messages=[{"role": "user", "content": "Hi"}])
+    # without warm-up or keep-alive, requests carry no trace observer at all
+    assert untracked._warmer.request_observer() is None
+    assert untracked.connection_stats()["request_cold_connects"] == 0
+    untracked.close()
+
+    server.client_ports.clear()
+    client = ProdPADLM_API.Client(api_key="test_key", base_url=url, track_connections=True)
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        list(pool.map(
+            lambda i: client.create(max_tokens=10, messages=[{"role": "user", "content": "Hi"}]),
+            range(12),
+        ))
+    stats = client.connection_stats()
+    client.close()
+
+    assert stats["request_cold_connects"] == len(server.client_ports)
+    assert stats["probe_cold_connects"] == 0
+    assert stats["warm_connections"] == len(server.client_ports)
+
+
+def test_shared_client_reuses_pooled_connections_across_threads(local_server):
+    server, url = local_server
+    client = ProdPADLM_API.Client(api_key="test_key", base_url=url)
+
+    def ask(i):
+        return client.create(max_tokens=10, messages=[{"role": "user", "content": str(i)}])
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        replies = list(pool.map(ask, range(40)))
+    client.close()
+
+    assert [r.content[0].text for r in replies] == [str(i) for i in range(40)]
+    # every request came through the one pool: at most one connection per worker thread
+    assert 1 <= len(server.client_ports) <= 4
+
+
+def test_keepalive_probes_only_the_shortfall(local_server):
+    server, url = local_server
+    client = ProdPADLM_API.Client(api_key="test_key", base_url=url)
+    client.start_keepalive(min_idle=2, interval=0.02)
+    deadline = time.monotonic() + 5
+    while client.connection_stats()["probes"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    stats = client.connection_stats()
+
+    # two fresh connections already cover min_idle, so later ticks send nothing
+    assert stats["keepalive_running"]
+    assert stats["probes"] == 2 and stats["probe_cold_connects"] == 2
+    assert stats["warm_connections"] == 2
+
+    # once they near expiry they are re-probed over the same pooled connections
+    client._warmer.keepalive_expiry = 0.1
+    while client.connection_stats()["probes"] < 6 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stats = client.connection_stats()
+    client.close()
+
+    assert stats["probes"] >= 6 and stats["probe_cold_connects"] == 2
+    assert stats["request_cold_connects"] == 0
+    assert server.probe_api_keys == {None}
+    assert not client.connection_stats()["keepalive_running"]
+
+
+def test_chat_owns_keepalive_thread(local_server):
+    _, url = local_server
+    chat = ProdPadLMChat(prodpadlm_api_url=url, prodpadlm_api_key="test_key", keepalive_min_idle=1)
+    assert chat.connection_stats()["keepalive_running"]
+    chat.close()
+    assert not chat.connection_stats()["keepalive_running"]
+
+    chat = ProdPadLMChat(prodpadlm_api_url=url, prodpadlm_api_key="test_key", keepalive_min_idle=1)
+    thread = chat._client._warmer._thread
+    del chat
+    gc.collect()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+STREAM_TEXT = "Hello there, this stream survives dropped connections."
+
+
+@pytest.fixture
+def flaky_stream_server():
+    """Streams STREAM_TEXT in 5-character deltas, cutting the connection after
+    ``server.disconnect_after[i]`` deltas on the i-th request and honouring
+    ``resume`` requests with a 3-character replay overlap. With
+    ``server.honour_resume = False`` a resume request gets a brand-new
+    generation under a new message id instead."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _chunk(self, event):
+            data = json.dumps({"data": event}).encode() + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            self.server.requests.append(body)
+            cut = self.server.disconnect_after[len(self.server.requests) - 1:][:1]
+            resume = body.get("resume")
+            if resume and not self.server.honour_resume:
+                # a fresh generation under a new id, with no resume offset
+                start = 0
+                message = {"id": f"msg_{len(self.server.requests)}"}
+            else:
+                start = max(resume["offset"] - 3, 0) if resume else 0
+                message = {"id": "msg_1", "resumed_from": start}
+
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self._chunk({"type": "message_start", "message": message})
+            self._chunk({"type": "content_block_start", "index": 0, "content_block": {"type": "text"}})
+            for sent, i in enumerate(range(start, len(STREAM_TEXT), 5)):
+                if cut and sent == cut[0]:
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                delta = {"type": "text_delta", "text": STREAM_TEXT[i:i + 5]}
+                self._chunk({"type": "content_block_delta", "index": 0, "delta": delta})
+            self._chunk({"type": "content_block_stop", "index": 0})
+            self._chunk({"type": "message_stop"})
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.requests = []
+    server.disconnect_after = []
+    server.honour_resume = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_stream_resumes_after_disconnects(flaky_stream_server):
+    server, url = flaky_stream_server
+    server.disconnect_after = [2, 3]
+    client = ProdPADLM_API.Client(api_key="test_key", base_url=url)
+
+    events = list(client.stream(max_tokens=10, messages=[{"role": "user", "content": "Hi"}]))
+
+    assert "".join(t for e in events for t in e.text_stream) == STREAM_TEXT
+    assert [r.get("resume") for r in server.requests] == [
+        None,
+        {"message_id": "msg_1", "offset": 10},
+        {"message_id": "msg_1", "offset": 22},
+    ]
+
+
+def test_chat_stream_resumes_and_gives_up_after_max_resumes(flaky_stream_server):
+    server, url = flaky_stream_server
+    chat = ProdPadLMChat(prodpadlm_api_url=url, prodpadlm_api_key="test_key", streaming=True)
+
+    server.disconnect_after = [4]
+    assert chat.invoke([HumanMessage(content="Hi")]).content == STREAM_TEXT
+
+    server.requests.clear()
+    server.disconnect_after = [1, 1, 1]
+    with pytest.raises(httpx.RemoteProtocolError):
+        chat.invoke([HumanMessage(content="Hi")])
+    assert len(server.requests) == 3
+
+
+def test_profiler_times_async_stream_transport_stages(flaky_stream_server):
+    _, url = flaky_stream_server
+    client = ProdPADLM_API.AsyncClient(api_key="test_key", base_url=url)
+    profiler = Profiler()
+
+    async def stream():
+        with profiler.profile("astream"):
+            return [
+                t async for event in client.stream(max_tokens=10, messages=[{"role": "user", "content": "Hi"}])
+                for t in event.text_stream
+            ]
+
+    assert "".join(asyncio.run(stream())) == STREAM_TEXT
+    totals = profiler.totals()
+    for name in ("json_encode", "pool_acquire", "connect", "network", "stream_decode", "build_events"):
+        assert totals[name]["count"] >= 1
+
+
+def test_stream_refuses_to_splice_a_fresh_generation(flaky_stream_server):
+    server, url = flaky_stream_server
+    server.disconnect_after = [2]
+    server.honour_resume = False
+    client = ProdPADLM_API.Client(api_key="test_key", base_url=url)
+
+    delivered = []
+    with pytest.raises(StreamResumeError, match="did not resume"):
+        for event in client.stream(max_tokens=10, messages=[{"role": "user", "content": "Hi"}]):
+            delivered.extend(event.text_stream)
+
+    assert "".join(delivered) == STREAM_TEXT[:10]
+    assert len(server.requests) == 2
+
+
+def test_resume_without_resumed_from_is_rejected():
+    state = StreamResumeState()
+    state.filter({"type": "message_start", "message": {"id": "msg_1"}})
+    state.filter({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "Hello"}})
+    state.mark_resumed()
+
+    with pytest.raises(StreamResumeError, match="resumed_from=None"):
+        state.filter({"type": "message_start", "message": {"id": "msg_1"}})
+
+    state.mark_resumed()
+    with pytest.raises(StreamResumeError, match="before confirming"):
+        state.filter({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "x"}})